@@ -26,12 +26,16 @@
 from __future__ import unicode_literals
 
 import argparse
+import ast
+import collections
 import difflib
 import fnmatch
+import functools
 import io
+import itertools
 import logging
 import os
-import re  # noqa: F401 pylint: disable=W0611
+import re
 import shutil
 import subprocess
 import sys
@@ -88,6 +92,239 @@ def get_function(fn_name):
     return current
 
 
+# get_function only depends on its "module:function" argument. Used to resolve
+# the same function once when it is applied to many files.
+cached_get_function = functools.lru_cache(maxsize=128)(get_function)
+
+
+class _CompiledPatterns(dict):
+
+    """Compiled patterns by (pattern, flags), compiled again when missing.
+
+    The table is cleared when it is full. Code expressions look patterns up
+    each time they run (see _PrecompilePatterns), so a cleared pattern is
+    just compiled again on its next use.
+
+    """
+
+    maxsize = 512
+
+    def __missing__(self, key):
+        if len(self) >= self.maxsize:
+            self.clear()
+        return self.setdefault(key, re.compile(*key))
+
+
+# Patterns of re.sub calls found in code expressions.
+_patterns = _CompiledPatterns()
+
+# Characters with a special meaning in regular expressions.
+_regex_metacharacters = frozenset(".^$*+?{}[]\\|()")
+
+
+def _literal_flags(node):
+    """Return the value of re flags like re.I | re.M or None if not constant."""
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        left, right = _literal_flags(node.left), _literal_flags(node.right)
+        if left is None or right is None:
+            return None
+        return left | right
+    if (
+        isinstance(node, ast.Attribute)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == "re"
+    ):
+        flag = getattr(re, node.attr, None)
+        return int(flag) if isinstance(flag, re.RegexFlag) else None
+    try:
+        flag = ast.literal_eval(node)
+    except ValueError:
+        return None
+    return flag if isinstance(flag, int) else None
+
+
+def _plain_sub(call):
+    """Return (pattern, repl) if call is a re.sub that str.replace can do.
+
+    That is re.sub('pattern', 'repl', string) where the pattern has no
+    special characters and the replacement no backslash to expand.
+
+    """
+    func = call.func
+    if not (
+        isinstance(func, ast.Attribute)
+        and func.attr == "sub"
+        and isinstance(func.value, ast.Name)
+        and func.value.id == "re"
+        and len(call.args) == 3
+        and not call.keywords
+    ):
+        return None
+    try:
+        pattern, repl = [ast.literal_eval(arg) for arg in call.args[:2]]
+    except ValueError:
+        return None
+    if not (isinstance(pattern, unicode) and isinstance(repl, unicode)):
+        return None
+    if not pattern or _regex_metacharacters.intersection(pattern) or "\\" in repl:
+        return None
+    return pattern, repl
+
+
+class _PrecompilePatterns(ast.NodeTransformer):
+
+    """Replaces re.sub('literal', ...) calls with a precompiled pattern."""
+
+    def visit_Call(self, node):  # pylint: disable=invalid-name
+        """Rewrites re.sub(pattern, repl, string) as pattern.sub(repl, string).
+
+        The count argument is passed on to the pattern. The flags argument is
+        compiled in the pattern provided it is made of constants. Patterns
+        without special characters are only applied to variables that
+        contain them, or turned into str.replace calls when the replacement
+        is a plain string too.
+
+        """
+        self.generic_visit(node)
+        plain = _plain_sub(node)
+        if plain:
+            replace = ast.Attribute(node.args[2], "replace", ast.Load())
+            constants = [ast.Constant(value) for value in plain]
+            return ast.copy_location(ast.Call(replace, constants, []), node)
+        func = node.func
+        if not (
+            isinstance(func, ast.Attribute)
+            and func.attr == "sub"
+            and isinstance(func.value, ast.Name)
+            and func.value.id == "re"
+            and 3 <= len(node.args) <= 5
+            and all(kwd.arg in ("count", "flags") for kwd in node.keywords)
+        ):
+            return node
+        try:
+            pattern = ast.literal_eval(node.args[0])
+        except ValueError:
+            return node
+        if not isinstance(pattern, unicode):
+            return node
+        args = node.args[1:4]
+        keywords = [kwd for kwd in node.keywords if kwd.arg == "count"]
+        flags_nodes = node.args[4:] + [
+            kwd.value for kwd in node.keywords if kwd.arg == "flags"
+        ]
+        flags = _literal_flags(flags_nodes[0]) if flags_nodes else 0
+        if flags is None:
+            return node
+        key = (pattern, flags)
+        try:
+            _patterns[key]  # Compiles the pattern to check it now.
+        except re.error:
+            return node  # Let re.sub report the error when it runs.
+        sub = ast.parse("_patterns[{!r}].sub".format(key), mode="eval").body
+        call = ast.Call(sub, args, keywords)
+        string = args[1]
+        if (
+            flags
+            or not pattern
+            or _regex_metacharacters.intersection(pattern)
+            or not isinstance(string, ast.Name)
+        ):
+            return ast.copy_location(call, node)
+        # The pattern is a plain string: only run the substitution on strings
+        # that contain it, which the in operator finds faster than re.
+        contains = ast.Compare(
+            ast.Constant(pattern), [ast.In()], [ast.Name(string.id, ast.Load())]
+        )
+        skip = ast.IfExp(contains, call, ast.Name(string.id, ast.Load()))
+        return ast.copy_location(skip, node)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_code_expr(code):
+    """Compile a code expression, reusing the code object of an earlier call.
+
+    Calls to re.sub with a literal pattern are rewritten to use a pattern
+    compiled once instead of looking it up in the re module cache for each
+    line.
+
+    Arguments:
+      code (str): python expression to compile.
+
+    """
+    tree = _PrecompilePatterns().visit(ast.parse(code, "<string>", "eval"))
+    return compile(ast.fix_missing_locations(tree), "<string>", "eval")
+
+
+@functools.lru_cache(maxsize=256)
+def literal_replacement(code):
+    """Return (old, new) if code is line.replace('old', 'new'), None otherwise.
+
+    Such expressions can be applied to all the lines of a file with
+    str.replace directly instead of evaluating the code once per line. So
+    can re.sub('old', 'new', line) when it does the same as str.replace.
+
+    Arguments:
+      code (str): python expression.
+
+    """
+    try:
+        call = ast.parse(code, "<string>", "eval").body
+    except SyntaxError:
+        return None
+    if isinstance(call, ast.Call) and len(call.args) == 3:
+        plain = _plain_sub(call)
+        string = call.args[2]
+        if plain and isinstance(string, ast.Name) and string.id == "line":
+            return plain
+    if not (
+        isinstance(call, ast.Call)
+        and isinstance(call.func, ast.Attribute)
+        and call.func.attr == "replace"
+        and isinstance(call.func.value, ast.Name)
+        and call.func.value.id == "line"
+        and len(call.args) == 2
+        and not call.keywords
+    ):
+        return None
+    try:
+        old, new = [ast.literal_eval(arg) for arg in call.args]
+    except ValueError:
+        return None
+    if not (isinstance(old, unicode) and isinstance(new, unicode)):
+        return None
+    return old, new
+
+
+def replace_literals(lines, replacements):
+    """Apply str.replace with each (old, new) pair to all the lines.
+
+    When the lines are newline terminated and the strings have no newline,
+    the replacements are made on the whole text at once instead of line by
+    line, which gives the same lines with far fewer calls.
+
+    Arguments:
+      lines (list of str): lines to edit.
+      replacements (list of tuples): pairs of old and new strings.
+
+    """
+    text = "".join(lines)
+    if (
+        lines
+        and all(old and "\n" not in old + new for old, new in replacements)
+        and all(map(unicode.endswith, lines[:-1], itertools.repeat("\n")))
+        and text.count("\n") == len(lines) - (not lines[-1].endswith("\n"))
+    ):
+        for old, new in replacements:
+            text = text.replace(old, new)
+        new_lines = io.StringIO(text).readlines()
+        if len(new_lines) < len(lines):
+            new_lines.append("")  # The last line ended up empty.
+        return new_lines
+    for old, new in replacements:
+        lines = [line.replace(old, new) for line in lines]
+    return lines
+
+
 def readlines(input_):
     """Return lines from input."""
     try:
@@ -97,6 +334,116 @@ def readlines(input_):
         raise
 
 
+_hunk_header = re.compile(r"@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@")
+
+
+def _positional_diff(from_lines, to_lines, n):
+    """Yield the hunks of a unified diff of lists of the same length.
+
+    Lines are compared at the same index only, which is what editing a file
+    line by line produces. Runs of changed lines less than 2 * n lines apart
+    share a hunk, the same way difflib groups them.
+
+    """
+    runs = []
+    start = None
+    for index, (from_line, to_line) in enumerate(zip(from_lines, to_lines)):
+        if from_line != to_line:
+            if start is None:
+                start = index
+        elif start is not None:
+            runs.append((start, index))
+            start = None
+    if start is not None:
+        runs.append((start, len(from_lines)))
+
+    groups = [[runs[0]]]
+    for run in runs[1:]:
+        if run[0] - groups[-1][-1][1] > 2 * n:
+            groups.append([run])
+        else:
+            groups[-1].append(run)
+    for group in groups:
+        first = max(group[0][0] - n, 0)
+        last = min(group[-1][1] + n, len(from_lines))
+        length = last - first
+        if length == 1:
+            lines_range = "{}".format(first + 1)
+        else:
+            lines_range = "{},{}".format(first + 1, length)
+        yield "@@ -{} +{} @@\n".format(lines_range, lines_range)
+        context_start = first
+        for run_start, run_stop in group:
+            for line in from_lines[context_start:run_start]:
+                yield " " + line
+            for line in from_lines[run_start:run_stop]:
+                yield "-" + line
+            for line in to_lines[run_start:run_stop]:
+                yield "+" + line
+            context_start = run_stop
+        for line in from_lines[context_start:last]:
+            yield " " + line
+
+
+def unified_diff(from_lines, to_lines, fromfile="", tofile="", n=3, aligned=False):
+    """Return a unified diff of the lines like difflib.unified_diff.
+
+    When lines are aligned, as when code expressions edit a file line by
+    line, they are compared at the same index in linear time.
+
+    Otherwise, lines common to the start and to the end of both lists are
+    only needed as context, so they are trimmed to n lines before handing
+    the changed region over to difflib. The line numbers in the hunk headers
+    are then shifted back to match the original lists.
+
+    Arguments:
+      from_lines (list of str): original lines.
+      to_lines (list of str): modified lines.
+      fromfile (str): name of the original file in the header.
+      tofile (str): name of the modified file in the header.
+      n (int): number of context lines.
+      aligned (bool): lines at the same index in both lists correspond to
+        each other.
+
+    """
+    if from_lines == to_lines:
+        return
+    if aligned and len(from_lines) == len(to_lines):
+        yield "--- {}\n".format(fromfile)
+        yield "+++ {}\n".format(tofile)
+        for diff in _positional_diff(from_lines, to_lines, n):
+            yield diff
+        return
+    size = min(len(from_lines), len(to_lines))
+    start = 0
+    while start < size and from_lines[start] == to_lines[start]:
+        start += 1
+    end = 0
+    while end < size - start and from_lines[-1 - end] == to_lines[-1 - end]:
+        end += 1
+    offset = max(start - n, 0)
+    from_stop = len(from_lines) - max(end - n, 0)
+    to_stop = len(to_lines) - max(end - n, 0)
+    diffs = difflib.unified_diff(
+        from_lines[offset:from_stop],
+        to_lines[offset:to_stop],
+        fromfile=fromfile,
+        tofile=tofile,
+        n=n,
+    )
+    for diff in diffs:
+        match = _hunk_header.match(diff) if offset else None
+        if match:
+            from_start, from_length, to_start, to_length = match.groups()
+            diff = "@@ -{}{} +{}{} @@\n".format(
+                int(from_start) + offset,
+                from_length or "",
+                int(to_start) + offset,
+                to_length or "",
+            )
+        yield diff
+
+
 class MassEdit(object):
 
     """Mass edit lines of files."""
@@ -150,28 +497,47 @@ class MassEdit(object):
             globals()[mod] = __import__(mod.strip())
 
     @staticmethod
-    def __edit_line(line, code, code_obj):  # pylint: disable=R0201
-        """Edit a line with one code object built in the ctor."""
-        try:
-            # pylint: disable=eval-used
-            result = eval(code_obj, globals(), locals())
-        except TypeError as ex:
-            log.error("failed to execute %s: %s", code, ex)
-            raise
+    def __to_line(result, line, code):
+        """Convert the result of a code expression evaluated on line to text."""
         if result is None:
             log.error("cannot process line '%s' with %s", line, code)
             raise RuntimeError("failed to process line")
         elif isinstance(result, list) or isinstance(result, tuple):
-            line = unicode(" ".join([unicode(res_element) for res_element in result]))
-        else:
-            line = unicode(result)
-        return line
+            return unicode(" ".join([unicode(res_element) for res_element in result]))
+        return unicode(result)
+
+    def edit_lines(self, lines):
+        """Edit lines one at a time using the code expressions.
+
+        The namespace the code expressions are evaluated in is set up once
+        per call and only the line variable changes from one line to the
+        next.
+
+        Arguments:
+          lines (iterable of str): lines to edit.
+
+        """
+        namespace = globals()
+        local_vars = {}
+        code_objs = list(self.code_objs.items())
+        for line in lines:
+            for code, code_obj in code_objs:
+                local_vars["line"] = line
+                try:
+                    # pylint: disable=eval-used
+                    result = eval(code_obj, namespace, local_vars)
+                except TypeError as ex:
+                    log.error("failed to execute %s: %s", code, ex)
+                    raise
+                if isinstance(result, unicode):
+                    line = result
+                else:
+                    line = self.__to_line(result, line, code)
+            yield line
 
     def edit_line(self, line):
         """Edit a single line using the code expression."""
-        for code, code_obj in self.code_objs.items():
-            line = self.__edit_line(line, code, code_obj)
-        return line
+        return next(self.edit_lines([line]))
 
     def edit_content(self, original_lines, file_name):
         """Processes a file contents.
@@ -185,7 +551,11 @@ class MassEdit(object):
           file_name (str): name of the file.
 
         """
-        lines = [self.edit_line(line) for line in original_lines]
+        replacements = [literal_replacement(code) for code in self.code_objs]
+        if replacements and all(replacements):
+            lines = replace_literals(list(original_lines), replacements)
+        else:
+            lines = list(self.edit_lines(original_lines))
         for function in self._functions:
             try:
                 lines = list(function(lines, file_name))
@@ -199,6 +569,49 @@ class MassEdit(object):
                 raise  # Let the exception be handled at a higher level.
         return lines
 
+    def edit_text(self, text, file_name="<string>"):
+        """Edit text in memory, returns the new lines and the unified diff.
+
+        Unlike edit_file, nothing is read from or written to disk and the
+        registered executables are not run.
+
+        Arguments:
+          text (str, unicode): content to edit.
+          file_name (str): name used for the functions and the diff header.
+
+        """
+        from_lines = readlines(io.StringIO(text))
+        to_lines = self.edit_content(from_lines, file_name)
+        diffs = unified_diff(
+            from_lines,
+            to_lines,
+            fromfile=file_name,
+            tofile="<new>",
+            aligned=not self._functions,
+        )
+        return to_lines, list(diffs)
+
+    def edit_stream(self, stream, name="<stream>", as_text=False):
+        """Edit a seekable text stream in place, returns the unified diff.
+
+        Arguments:
+          stream (io.TextIOBase): stream to read from and write back to.
+          name (str): name used for the functions and the diff header.
+          as_text (bool): return the unified diff joined in a single string.
+
+        """
+        diffs = self._edit_stream(stream, name)[1]
+        return "".join(diffs) if as_text else diffs
+
+    def _edit_stream(self, stream, name):
+        """Edit stream in place, returns the new lines and the unified diff."""
+        to_lines, diffs = self.edit_text(stream.read(), name)
+        if not self.dry_run:
+            stream.seek(0)
+            stream.truncate()
+            stream.write("".join(to_lines))
+        return to_lines, diffs
+
     def write_to(self, file_name, to_lines):
         """Writes output lines to file."""
         bak_file_name = file_name + ".bak"
@@ -215,7 +628,7 @@ class MassEdit(object):
             with io.open(
                 file_name, "w", encoding=self.encoding, newline=self.newline
             ) as new:
-                new.writelines(to_lines)
+                new.write("".join(to_lines))
             # Keeps mode of original file.
             shutil.copymode(bak_file_name, file_name)
         except Exception as err:
@@ -236,11 +649,21 @@ class MassEdit(object):
         except OSError as err:
             log.warning("failed to remove backup %s: %s", bak_file_name, err)
 
-    def edit_file(self, file_name):
+    def edit_file(self, file_name, as_text=False):
         """Edit file in place, returns a list of modifications (unified diff).
 
         Arguments:
           file_name (str, unicode): The name of the file.
+          as_text (bool): return the unified diff joined in a single string.
+
+        """
+        diffs = self._edit_file(file_name)[1]
+        return "".join(diffs) if as_text else list(diffs)
+
+    def _edit_file(self, file_name):
+        """Edit file in place, returns the new lines and the unified diff.
+
+        The diff is computed lazily, as the caller iterates over it.
 
         """
         if file_name == "-":
@@ -265,17 +688,25 @@ class MassEdit(object):
         else:
             to_lines = from_lines
 
-        # unified_diff wants structure of known length. Convert to a list.
-        to_lines = list(self.edit_content(to_lines, file_name))
-        diffs = difflib.unified_diff(
-            from_lines, to_lines, fromfile=file_name, tofile="<new>"
+        to_lines = self.edit_content(to_lines, file_name)
+        if not isinstance(to_lines, list):
+            # unified_diff wants structure of known length. Convert to a list.
+            to_lines = list(to_lines)
+        # Code expressions edit lines one by one but functions and
+        # executables may insert or remove lines anywhere.
+        diffs = unified_diff(
+            from_lines,
+            to_lines,
+            fromfile=file_name,
+            tofile="<new>",
+            aligned=not (self._functions or self._executables),
         )
         if not self.dry_run:
             if file_name == "-":
-                sys.stdout.writelines(to_lines)
+                sys.stdout.write("".join(to_lines))
             else:
                 self.write_to(file_name, to_lines)
-        return list(diffs)
+        return to_lines, diffs
 
     def append_code_expr(self, code):
         """Compile argument and adds it to the list of code objects."""
@@ -286,7 +717,7 @@ class MassEdit(object):
             raise TypeError("string expected")
         log.debug("compiling code %s...", code)
         try:
-            code_obj = compile(code, "<string>", "eval")
+            code_obj = compile_code_expr(code)
             self.code_objs[code] = code_obj
         except SyntaxError as syntax_err:
             log.error("cannot compile %s: %s", code, syntax_err)
@@ -305,7 +736,7 @@ class MassEdit(object):
 
         """
         if not hasattr(function, "__call__"):
-            function = get_function(function)
+            function = cached_get_function(function)
             if not hasattr(function, "__call__"):
                 raise ValueError("function is expected to be callable")
         self._functions.append(function)
@@ -350,11 +781,12 @@ class MassEdit(object):
             self.append_executable(exc)
 
 
-def parse_command_line(argv):
-    """Parse command line argument. See -h option.
+@functools.lru_cache(maxsize=8)
+def _build_parser(program):
+    """Build the command line parser once per program name.
 
     Arguments:
-      argv: arguments on the command line must include caller file name.
+      program: name of the program shown in the examples.
 
     """
     import textwrap
@@ -374,7 +806,7 @@ def parse_command_line(argv):
     # Will transform virtual methods (almost) to MOCK_METHOD suitable for gmock (see https://github.com/google/googletest).
     {0} -e "re.sub(r'\s*virtual\s+([\w:<>,\s&*]+)\s+(\w+)(\([^\)]*\))\s*((\w+)*)(=\s*0)?;', 'MOCK_METHOD(\g<1>, \g<2>, \g<3>, (\g<4>, override));', line)" test.cpp
     """
-    ).format(os.path.basename(argv[0]))
+    ).format(program)
     formatter_class = argparse.RawDescriptionHelpFormatter
     parser = argparse.ArgumentParser(
         description="Python mass editor",
@@ -442,7 +874,6 @@ def parse_command_line(argv):
         "--output",
         metavar="FILE",
         type=argparse.FileType("w"),
-        default=sys.stdout,
         help="redirect output to a file",
     )
     parser.add_argument(
@@ -458,13 +889,34 @@ def parse_command_line(argv):
     parser.add_argument(
         "--newline", dest="newline", help="Newline character for output files"
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes editing files in parallel (default 1)",
+    )
     parser.add_argument(
         "patterns",
         metavar="file pattern",
         nargs="*",  # argparse.REMAINDER,
         help="shell-like file name patterns to process or - to read from stdin.",
     )
+    return parser
+
+
+def parse_command_line(argv):
+    """Parse command line argument. See -h option.
+
+    Arguments:
+      argv: arguments on the command line must include caller file name.
+
+    """
+    parser = _build_parser(os.path.basename(argv[0]))
     arguments = parser.parse_args(argv[1:])
+    if arguments.output is None:
+        # Not a parser default so that the cached parser follows sys.stdout.
+        arguments.output = sys.stdout
 
     if not (
         arguments.expressions
@@ -473,6 +925,8 @@ def parse_command_line(argv):
         or arguments.executables
     ):
         parser.error("--expression, --function, --generate or --executable missing")
+    if arguments.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     # Sets log level to WARN going more verbose for each new -V.
     log.setLevel(max(3 - arguments.verbose_count, 0) * 10)
@@ -495,18 +949,57 @@ def get_paths(patterns, start_dirs=None, max_depth=1):
 
     if not start_dirs or start_dirs == ".":
         start_dirs = os.getcwd()
+    matchers = [
+        re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+        for pattern in patterns
+    ]
     for start_dir in start_dirs.split(","):
-        for root, dirs, files in os.walk(start_dir):  # pylint: disable=W0612
-            if max_depth is not None:
-                relpath = os.path.relpath(root, start=start_dir)
-                depth = len(relpath.split(os.sep))
-                if depth > max_depth:
-                    continue
-            names = []
-            for pattern in patterns:
-                names += fnmatch.filter(files, pattern)
-            for name in names:
-                path = os.path.join(root, name)
+        for path in _walk(start_dir, 0, max_depth, matchers):
+            yield path
+
+
+def _walk(directory, level, max_depth, matchers):
+    """Yield the files matching any of the matchers, top-down.
+
+    A directory's files come before those of its subdirectories. Like
+    os.walk, symbolic links to directories are not followed and
+    directories that can't be listed are skipped. The start directory and
+    its subdirectories are at depth 1, their own subdirectories at depth 2
+    and so on.
+
+    Arguments:
+      directory (str): directory to look into.
+      level (int): number of directories between directory and the start.
+      max_depth (int): maximum depth of the directories to look into.
+      matchers (list of callables): match functions of compiled patterns.
+
+    """
+    try:
+        with os.scandir(directory) as scanner:
+            entries = list(scanner)
+    except OSError:
+        return
+    dirs = []
+    files = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            dirs.append(entry)
+        else:
+            files.append(entry)
+    if max_depth is None or max(level, 1) <= max_depth:
+        for match in matchers:
+            for entry in files:
+                if match(os.path.normcase(entry.name)):
+                    yield entry.path
+    if max_depth is not None and level + 1 > max_depth:
+        return
+    for entry in dirs:
+        if not entry.is_symlink():
+            for path in _walk(entry.path, level + 1, max_depth, matchers):
                 yield path
 
 
@@ -548,6 +1041,69 @@ def generate_fixer_file(output):
     return
 
 
+def _edit_named_stream(editor, name, stream):
+    """Edit stream with editor, returns the new lines and the diff."""
+    lines, diffs = editor._edit_stream(stream, name)  # pylint: disable=protected-access
+    return lines, "".join(diffs)
+
+
+def _edit_path(editor, path):
+    """Edit path with editor, returns the new lines and the diff.
+
+    Both are None if the file can't be decoded.
+
+    """
+    try:
+        to_lines, diffs = editor._edit_file(path)  # pylint: disable=protected-access
+        return to_lines, "".join(diffs)
+    except UnicodeDecodeError as err:
+        log.error("failed to process %s: %s", path, err)
+        return None, None
+
+
+# Editor of a worker process and whether to send the edited lines back to
+# the parent process, set up once by _init_worker.
+_worker_editor = None
+_worker_return_content = False
+
+
+def _init_worker(settings):
+    """Build the editor used by a worker process for all its paths."""
+    global _worker_editor, _worker_return_content  # pylint: disable=global-statement
+    _worker_return_content = settings["return_content"]
+    _worker_editor = MassEdit(
+        dry_run=settings["dry_run"],
+        encoding=settings["encoding"],
+        newline=settings["newline"],
+    )
+    _worker_editor.set_code_exprs(settings["expressions"])
+    _worker_editor.set_functions(settings["functions"])
+    _worker_editor.set_executables(settings["executables"])
+
+
+def _edit_path_in_worker(path):
+    """Edit path in a worker process with the editor built by _init_worker."""
+    to_lines, diff = _edit_path(_worker_editor, path)
+    if not _worker_return_content:
+        to_lines = None  # Spare sending them back to the parent process.
+    return to_lines, diff
+
+
+def _edit_paths_in_workers(paths, settings, jobs):
+    """Edit paths in a pool of processes, returns each path with its results."""
+    import concurrent.futures
+
+    workers = min(jobs, len(paths))
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(settings,)
+    ) as executor:
+        # A few chunks per worker keep them busy without a round trip per
+        # path. Results come back in order for the output.
+        chunksize = max(len(paths) // (workers * 4), 1)
+        results = executor.map(_edit_path_in_worker, paths, chunksize=chunksize)
+        return list(zip(paths, results))
+
+
 # pylint: disable=too-many-arguments, too-many-locals
 def edit_files(
     patterns,
@@ -560,6 +1116,9 @@ def edit_files(
     output=sys.stdout,
     encoding=None,
     newline=None,
+    jobs=1,
+    input_streams=None,
+    return_content=False,
 ):
     """Process patterns with MassEdit.
 
@@ -572,9 +1131,14 @@ def edit_files(
       start_dirs: workspace(ies) where to start the file search.
       dry_run: only display differences if True. Save modified file otherwise.
       output: handle where the output should be redirected.
+      jobs: number of processes editing files in parallel.
+      input_streams: mapping of names to text streams edited instead of the
+        files matching the patterns.
+      return_content: return the new content of each file processed.
 
     Return:
-      list of files processed.
+      list of files processed or, if return_content is set, an ordered
+      dictionary of their new content by file processed.
 
     """
     if not is_list(patterns):
@@ -586,6 +1150,12 @@ def edit_files(
     if executables and not is_list(executables):
         raise TypeError("executables should be a list of program names")
 
+    # Worker processes rebuild their editor from the arguments, which must
+    # be picklable under any start method: functions as module:name only.
+    workers_can_rebuild = all(
+        isinstance(function, (str, unicode)) and ":" in function
+        for function in functions or []
+    )
     editor = MassEdit(dry_run=dry_run, encoding=encoding, newline=newline)
     if expressions:
         editor.set_code_exprs(expressions)
@@ -594,27 +1164,60 @@ def edit_files(
     if executables:
         editor.set_executables(executables)
 
+    if input_streams is not None:
+        results = (
+            (name, _edit_named_stream(editor, name, stream))
+            for name, stream in input_streams.items()
+        )
+    else:
+        paths = get_paths(patterns, start_dirs=start_dirs, max_depth=max_depth)
+        if jobs > 1 and not workers_can_rebuild:
+            log.warning(
+                "functions must be given as module:name to edit files in "
+                "parallel, using a single process"
+            )
+            jobs = 1
+        if jobs > 1:
+            paths = list(paths)
+        if jobs > 1 and len(paths) > 1:
+            # Workers rebuild their own editor: compiled code does not pickle.
+            settings = {
+                "dry_run": dry_run,
+                "encoding": encoding,
+                "newline": newline,
+                "expressions": list(editor.code_objs),
+                "functions": functions or [],
+                "executables": executables or [],
+                "return_content": return_content,
+            }
+            results = _edit_paths_in_workers(paths, settings, jobs)
+        else:
+            results = ((path, _edit_path(editor, path)) for path in paths)
+
     processed_paths = []
-    for path in get_paths(patterns, start_dirs=start_dirs, max_depth=max_depth):
-        try:
-            diffs = list(editor.edit_file(path))
-            if dry_run:
-                # At this point, encoding is the input encoding.
-                diff = "".join(diffs)
-                if not diff:
-                    continue
-                # The encoding of the target output may not match the input
-                # encoding. If it's defined, we round trip the diff text
-                # to bytes and back to silence any conversion errors.
-                encoding = output.encoding
-                if encoding:
-                    bytes_diff = diff.encode(encoding=encoding, errors="ignore")
-                    diff = bytes_diff.decode(encoding=output.encoding)
-                output.write(diff)
-        except UnicodeDecodeError as err:
-            log.error("failed to process %s: %s", path, err)
+    contents = collections.OrderedDict()
+    for path, (to_lines, diff) in results:
+        if diff is None:
             continue
-        processed_paths.append(os.path.abspath(path))
+        if dry_run:
+            # At this point, encoding is the input encoding.
+            if not diff:
+                continue
+            # The encoding of the target output may not match the input
+            # encoding. If it's defined, we round trip the diff text
+            # to bytes and back to silence any conversion errors.
+            encoding = output.encoding
+            if encoding:
+                bytes_diff = diff.encode(encoding=encoding, errors="ignore")
+                diff = bytes_diff.decode(encoding=output.encoding)
+            output.write(diff)
+        if input_streams is None:
+            path = os.path.abspath(path)
+        processed_paths.append(path)
+        if return_content:
+            contents[path] = "".join(to_lines)
+    if return_content:
+        return contents
     return processed_paths
 
 
@@ -639,6 +1242,7 @@ def command_line(argv):
         output=arguments.output,
         encoding=arguments.encoding,
         newline=arguments.newline,
+        jobs=arguments.jobs,
     )
     # If the output is not sys.stdout, we need to close it because
     # argparse.FileType does not do it for us.
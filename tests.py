@@ -25,14 +25,16 @@
 
 from __future__ import unicode_literals
 
+import difflib
 import io
 import logging
 import os
 import platform
+import re
 import shutil
+import stat
 import sys
 import tempfile
-import textwrap
 import unittest
 
 import massedit
@@ -77,17 +79,18 @@ If the implementation is easy to explain, it may be a good idea.
 Namespaces are one honking great idea -- let's do more of those!
 """
 )
+zen_guido = zen.replace("unless you're Dutch.", "unless you're Guido.")
 
+digit_strings = frozenset(str(x) for x in range(10))
 
-class Workspace:
-    """Wraps creation of files/workspace.
+# Diff of a "some text <n>" file edited into "some blah blah <n>".
+dry_run_diff_template = (
+    "--- {}\n" "+++ <new>\n" "@@ -1 +1 @@\n" "-some text {}+some blah blah {}"
+)
 
-    For some reason tempfile.mkdtemp() causes problems with Python 2.7:
-      File "C:\\Python27\\lib\\random.py", line 113, in seed
-        a = long(_hexlify(_urandom(2500)), 16)
-    TypeError: 'NoneType' object is not callable
 
-    """
+class Workspace:
+    """Wraps creation of files/workspace."""
 
     def __init__(self, parent_dir=None):
         """Initialize Temp class.
@@ -95,51 +98,35 @@ class Workspace:
         Arguments:
           parent_dir (str): workspace where to create temporary files/dirs.
 
-        If parent_dir is not given, uses tempfile pacakge to try to get a
-        temporary directory. If that fails, use the current working directory.
+        If parent_dir is not given, the tempfile package picks the default
+        temporary directory.
 
         """
+        self._temp_dir = tempfile.TemporaryDirectory(prefix="massedit", dir=parent_dir)
+        self.top_dir = self._temp_dir.name
 
-        if parent_dir is None:
-            parent_dir = tempfile.tempdir
-            if parent_dir is None:
-                parent_dir = os.path.abspath(os.path.curdir)
-        self.top_dir = self.get_directory(parent_dir=parent_dir)
-
-    # Cannot use __del__ here because self.top_dir does not always exist
-    # when _del__ is called: http://stackoverflow.com/questions/865115/
     def cleanup(self):
         """Delete temporary directories/files."""
-        shutil.rmtree(self.top_dir)
-
-    def get_base_name(self):
-        """Create a base"""
-        import binascii
-
-        suffix = binascii.hexlify(os.urandom(4)).decode("ascii")
-        return "massedit" + suffix
+        self._temp_dir.cleanup()
 
     def get_directory(self, parent_dir=None):
         """Create a temporary directory in parent_dir."""
-
         if parent_dir is None:
             parent_dir = self.top_dir
-        dir_name = os.path.join(parent_dir, self.get_base_name())
-        os.mkdir(dir_name)
-        return dir_name
+        return tempfile.mkdtemp(prefix="massedit", dir=parent_dir)
 
     def get_file(self, parent_dir=None, extension=None):
-        """Get a new temporary file name."""
-
+        """Create a new empty temporary file and return its name."""
         if not parent_dir:
             parent_dir = self.top_dir
-        file_name = os.path.join(parent_dir, self.get_base_name())
-        if extension:
-            file_name += extension
+        fd, file_name = tempfile.mkstemp(
+            suffix=extension, prefix="massedit", dir=parent_dir
+        )
+        os.close(fd)
         return file_name
 
 
-class LogInterceptor:  # pylint: disable=too-few-public-methods
+class LogInterceptor:
     """Replaces all log handlers and redirect log to the stream."""
 
     def __init__(self, logger):
@@ -172,7 +159,13 @@ class LogInterceptor:  # pylint: disable=too-few-public-methods
         self.handler.flush()
         return self.__content.getvalue()
 
-    def __del__(self):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
         """Reset the handlers the way they were."""
         self.logger.removeHandler(self.handler)
         for hdlr in self.__handlers:
@@ -180,20 +173,17 @@ class LogInterceptor:  # pylint: disable=too-few-public-methods
         self.logger.propagate = self.__propagate
 
 
+def identity(lines, _):
+    """Helper function that returns the lines unchanged."""
+    yield from lines
+
+
 def dutch_is_guido(lines, _):
     """Helper function that substitute Dutch with Guido."""
-    import re
-
     for line in lines:
         yield re.sub("Dutch", "Guido", line)
 
 
-def remove_module(module_name):
-    """Remove the module from memory."""
-    if module_name in sys.modules:
-        del sys.modules[module_name]
-
-
 class TestGetFunction(unittest.TestCase):  # pylint: disable=R0904
 
     """Test the functon get_function."""
@@ -204,6 +194,15 @@ class TestGetFunction(unittest.TestCase):  # pylint: disable=R0904
         # Functions are not the same but the code is.
         self.assertEqual(dutch_is_guido.__code__, function.__code__)
 
+    def test_cached_retrieval(self):
+        """Check the same specification is resolved only once."""
+        massedit.cached_get_function.cache_clear()
+        editor = massedit.MassEdit()
+        editor.append_function("tests:dutch_is_guido")
+        editor.append_function("tests:dutch_is_guido")
+        info = massedit.cached_get_function.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
 
 class TestMassEdit(unittest.TestCase):  # pylint: disable=R0904
 
@@ -236,20 +235,180 @@ class TestMassEdit(unittest.TestCase):  # pylint: disable=R0904
         new_line = self.editor.edit_line(original_line)
         self.assertEqual(new_line, "")
 
-    def test_syntax_error(self):
+    def test_code_expr_compiled_once(self):
+        """Check editors share the code object of the same expression."""
+        code = "re.sub('cat','horse',line)"
+        other_editor = massedit.MassEdit(code=code)
+        self.editor.append_code_expr(code)
+        self.assertIs(self.editor.code_objs[code], other_editor.code_objs[code])
+
+    def test_literal_pattern_precompiled(self):
+        """Check re.sub with a literal pattern does not go through re."""
+        code = "re.sub('c(a)t', r'h\\1rse', line)"
+        self.editor.append_code_expr(code)
+        self.assertNotIn("re", self.editor.code_objs[code].co_names)
+        self.assertEqual(
+            self.editor.edit_line("What a nice cat!"), "What a nice harse!"
+        )
+
+    def test_plain_pattern_prefiltered(self):
+        """Check plain string patterns are only applied to lines with them."""
+        code = "re.sub('cat', r'\\g<0>s', line)"
+        self.editor.append_code_expr(code)
+        self.assertIn("cat", self.editor.code_objs[code].co_consts)
+        with mock.patch.object(massedit, "_patterns") as patterns:
+            self.assertEqual(self.editor.edit_line("nice dog"), "nice dog")
+        patterns.__getitem__.assert_not_called()
+        self.assertEqual(self.editor.edit_line("nice cat"), "nice cats")
+
+    def test_plain_sub_as_replace(self):
+        """Check re.sub with plain strings is turned into str.replace."""
+        code = "re.sub('cat', 'horse', line)"
+        self.editor.append_code_expr(code)
+        self.assertIn("replace", self.editor.code_objs[code].co_names)
+        self.assertNotIn("re", self.editor.code_objs[code].co_names)
+        self.assertEqual(self.editor.edit_line("cat, cat"), "horse, horse")
+        self.assertEqual(massedit.literal_replacement(code), ("cat", "horse"))
+        for code in ("re.sub('c.t', 'horse', line)", "re.sub('cat', r'\\n', line)"):
+            self.assertIsNone(massedit.literal_replacement(code))
+
+    def test_literal_pattern_count_and_flags(self):
+        """Check count and constant flags are kept on precompiled patterns."""
+        code = "re.sub('CAT', 'horse', line, 1, flags=re.I | re.M)"
+        self.editor.append_code_expr(code)
+        self.assertNotIn("re", self.editor.code_objs[code].co_names)
+        self.assertEqual(self.editor.edit_line("cat and Cat"), "horse and Cat")
+        code = "re.sub('cat', 'horse', line, count=1)"
+        self.editor.append_code_expr(code)
+        self.assertNotIn("re", self.editor.code_objs[code].co_names)
+
+    def test_computed_flags(self):
+        """Check re.sub with flags computed from the line still works."""
+        code = "re.sub('cat', 'horse', line, flags=len(line) and re.I)"
+        self.editor.append_code_expr(code)
+        self.assertIn("re", self.editor.code_objs[code].co_names)
+        self.assertEqual(self.editor.edit_line("CAT"), "horse")
+
+    def test_cleared_patterns_compiled_again(self):
+        """Check expressions still run once their pattern left the table."""
+        code = "re.sub('c(a)t', 'horse', line, flags=re.I)"
+        self.editor.append_code_expr(code)
+        self.assertIn(("c(a)t", re.I), massedit._patterns)
+        with mock.patch.dict(massedit._patterns, clear=True):
+            self.assertEqual(self.editor.edit_line("a CAT"), "a horse")
+
+    def test_computed_pattern(self):
+        """Check re.sub with a pattern computed from the line still works."""
+        self.editor.append_code_expr("re.sub(line[-4:-1], 'horse', line)")
+        new_line = self.editor.edit_line("What a nice cat!")
+        self.assertEqual(new_line, "What a nice horse!")
+
+    def test_literal_replacement(self):
+        """Check line.replace with literal arguments is recognized."""
+        self.assertEqual(
+            massedit.literal_replacement("line.replace('cat', 'horse')"),
+            ("cat", "horse"),
+        )
+        self.assertIsNone(massedit.literal_replacement("line.replace(line, '')"))
+        self.assertIsNone(massedit.literal_replacement("line.strip()"))
+
+    def test_literal_replacement_content(self):
+        """Check the str.replace fast path also applies to all lines."""
+        self.editor.append_code_expr("line.replace('cat', 'horse')")
+        self.editor.append_code_expr("line.replace('horse', 'pony')")
+        lines = self.editor.edit_content(["nice cat\n", "no dog\n"], "filename")
+        self.assertEqual(lines, ["nice pony\n", "no dog\n"])
+
+    def test_no_code_expr_skips_literals(self):
+        """Check functions alone don't go through the str.replace fast path."""
+        self.editor.append_function(lambda lines, _: lines)
+        with mock.patch("massedit.replace_literals") as replace_literals:
+            lines = self.editor.edit_content(["nice cat\n"], "filename")
+        replace_literals.assert_not_called()
+        self.assertEqual(lines, ["nice cat\n"])
+
+    def test_edit_lines(self):
+        """Check edit_lines applies the code expressions to each line lazily."""
+        self.editor.append_code_expr("re.sub('cat', 'horse', line)")
+        self.editor.append_code_expr("line.split()")
+        lines = self.editor.edit_lines(iter(["nice cat", "no dog"]))
+        self.assertEqual(next(lines), "nice horse")
+        self.assertEqual(list(lines), ["no dog"])
+
+    def test_edit_text(self):
+        """Check text can be edited without touching the file system."""
+        self.editor.append_code_expr("re.sub('Dutch', 'Guido', line)")
+        lines, diffs = self.editor.edit_text(zen)
+        self.assertEqual("".join(lines), zen_guido)
+        self.assertIn(
+            "-Although that way may not be obvious at first unless you're Dutch.\n",
+            diffs,
+        )
+        self.assertEqual(diffs[0], "--- <string>\n")
+
+    def test_edit_text_no_change(self):
+        """Check an unchanged text yields no diff."""
+        self.editor.append_code_expr("line")
+        lines, diffs = self.editor.edit_text("some text\nno newline", "name")
+        self.assertEqual(lines, ["some text\n", "no newline"])
+        self.assertEqual(diffs, [])
+
+    def test_api_streams(self):
+        """Check streams can be edited in place via api."""
+        stream = io.StringIO(zen)
+        processed = massedit.edit_files(
+            [],
+            ["re.sub('Dutch', 'Guido', line)"],
+            dry_run=False,
+            input_streams={"somefile.txt": stream},
+        )
+        self.assertEqual(processed, ["somefile.txt"])
+        self.assertEqual(stream.getvalue(), zen_guido)
+
+    def test_api_streams_dry_run(self):
+        """Check the diff of streams is written to the output."""
+        stream = io.StringIO(zen)
+        output = io.StringIO()
+        processed = massedit.edit_files(
+            [],
+            ["re.sub('Dutch', 'Guido', line)"],
+            output=output,
+            input_streams={"somefile.txt": stream, "other.txt": io.StringIO("")},
+        )
+        self.assertEqual(processed, ["somefile.txt"])
+        self.assertEqual(stream.getvalue(), zen)
+        self.assertTrue(output.getvalue().startswith("--- somefile.txt\n"))
+        self.assertIn("+Although that way may not be obvious", output.getvalue())
+
+    def test_replace_literals(self):
+        """Check literal replacements on the whole text give the same lines."""
+        replacements = [("cat", "horse"), ("horse", "pony")]
+        lines = massedit.replace_literals(["nice cat\n", "no dog\n"], replacements)
+        self.assertEqual(lines, ["nice pony\n", "no dog\n"])
+        lines = massedit.replace_literals(["a cat\n", "cat"], [("cat", "")])
+        self.assertEqual(lines, ["a \n", ""])
+        # Lines without newline must not be joined together.
+        lines = massedit.replace_literals(["ca", "t"], [("cat", "horse")])
+        self.assertEqual(lines, ["ca", "t"])
+        lines = massedit.replace_literals(["a cat\n"], [("cat", "\n")])
+        self.assertEqual(lines, ["a \n\n"])
+
+    @mock.patch.object(massedit, "log")
+    def test_syntax_error(self, _):
         """Check we get a SyntaxError if the code is not valid."""
-        with mock.patch("massedit.log", autospec=True):
-            with self.assertRaises(SyntaxError):
-                self.editor.append_code_expr("invalid expression")
-                self.assertIsNone(self.editor.code_objs)
+        with self.assertRaises(SyntaxError):
+            self.editor.append_code_expr("invalid expression")
+            self.assertIsNone(self.editor.code_objs)
 
     def test_invalid_code_expr2(self):
         """Check we get a SyntaxError if the code is missing an argument."""
         self.editor.append_code_expr("re.sub('def test', 'def toast')")
-        massedit.log.disabled = True
-        with self.assertRaises(TypeError):
-            self.editor.edit_line("some line")
-        massedit.log.disabled = False
+        logging.disable(logging.CRITICAL)
+        try:
+            with self.assertRaises(TypeError):
+                self.editor.edit_line("some line")
+        finally:
+            logging.disable(logging.NOTSET)
 
     def test_missing_module(self):
         """Check that missing module generates an exception."""
@@ -257,13 +416,13 @@ class TestMassEdit(unittest.TestCase):  # pylint: disable=R0904
         with self.assertRaises(NameError):
             self.editor.edit_line("need to edit a line to execute the code")
 
+    @mock.patch.dict(vars(massedit))
     def test_module_import(self):
         """Check the module import functinality."""
-        remove_module("random")
         self.editor.import_module("random")
         self.editor.append_code_expr("random.randint(0,9)")
         random_number = self.editor.edit_line("to be replaced")
-        self.assertIn(random_number, [str(x) for x in range(10)])
+        self.assertIn(random_number, digit_strings)
 
     def test_file_edit(self):
         """Simple replacement check."""
@@ -304,18 +463,12 @@ class TestMassEditWithFile(unittest.TestCase):
 
     def test_non_utf8_with_utf8_setting(self):
         """Check files with non-utf8 characters are skipped with a warning."""
-        log_sink = LogInterceptor(massedit.log)
         content = unicode("This is ok\nThis \u00F1ot")
         self.write_input_file(content, encoding="cp1252")
-
-        def identity(lines, _):
-            """Return the line itself."""
-            for line in lines:
-                yield line
-
         self.editor.append_function(identity)
-        with self.assertRaises(UnicodeDecodeError):
-            _ = self.editor.edit_file(self.file_name)
+        with LogInterceptor(massedit.log) as log_sink:
+            with self.assertRaises(UnicodeDecodeError):
+                _ = self.editor.edit_file(self.file_name)
         self.assertIn("encoding error", log_sink.log)
 
     def test_handling_of_cp1252(self):
@@ -324,12 +477,6 @@ class TestMassEditWithFile(unittest.TestCase):
         self.editor.encoding = encoding
         content = unicode("This is ok\nThis \u00F1ot")
         self.write_input_file(content, encoding=encoding)
-
-        def identity(lines, _):
-            """Return the line itself."""
-            for line in lines:
-                yield line
-
         self.editor.append_function(identity)
         diffs = self.editor.edit_file(self.file_name)
         self.assertEqual(diffs, [])
@@ -341,12 +488,6 @@ class TestMassEditWithFile(unittest.TestCase):
         content = "This is a line finishing with CRLF\r\n"
 
         self.write_input_file(content)
-
-        def identity(lines, _):
-            """Return the line itself."""
-            for line in lines:
-                yield line
-
         self.editor.append_function(identity)
         diffs = self.editor.edit_file(self.file_name)
 
@@ -368,10 +509,27 @@ class TestMassEditWithZenFile(TestMassEditWithFile):  # pylint: disable=R0904
 
     """Test the command line interface of massedit.py with actual file."""
 
+    @classmethod
+    def setUpClass(cls):
+        """Encode the zen of Python once for all the tests."""
+        cls.text_bytes = zen.encode("utf-8")
+        cls.expected_first_diff = (
+            " There should be one-- and preferably only one --obvious way to do it.\n"
+            "-Although that way may not be obvious at first unless you're Dutch.\n"
+            "+Although that way may not be obvious at first unless you're Guido.\n"
+            " Now is better than never.\n"
+        )
+
     def setUp(self):
         """Use zen of Python as content."""
         TestMassEditWithFile.setUp(self)
-        self.write_input_file(zen)
+        fd = os.open(self.file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, self.text_bytes)
+        finally:
+            os.close(fd)
+        self.file_base_name = os.path.basename(self.file_name)
+        self.file_abspath = os.path.abspath(self.file_name)
 
     def test_setup(self):
         """Check that we have a temporary file to work with."""
@@ -382,14 +540,13 @@ class TestMassEditWithZenFile(TestMassEditWithFile):  # pylint: disable=R0904
         self.editor.append_code_expr("re.sub('Dutch', 'Guido', line)")
         diffs = self.editor.edit_file(self.file_name)
         self.assertEqual(len(diffs), 11)
-        expected_diffs = textwrap.dedent(
-            """
-         There should be one-- and preferably only one --obvious way to do it.
-        -Although that way may not be obvious at first unless you're Dutch.
-        +Although that way may not be obvious at first unless you're Guido.
-         Now is better than never.\n"""
-        )
-        self.assertEqual("".join(diffs[5:9]), "".join(expected_diffs[1:]))
+        self.assertEqual("".join(diffs[5:9]), self.expected_first_diff)
+
+    def test_replace_in_file_as_text(self):
+        """Check the diff can be returned as a single string."""
+        self.editor.append_code_expr("re.sub('Dutch', 'Guido', line)")
+        diff = self.editor.edit_file(self.file_name, as_text=True)
+        self.assertIn(self.expected_first_diff, diff)
 
     def test_replace_cannot_backup(self):
         """Check replacement fails if backup fails."""
@@ -405,7 +562,6 @@ class TestMassEditWithZenFile(TestMassEditWithFile):  # pylint: disable=R0904
 
     def test_command_line_replace(self):
         """Check simple replacement via command line."""
-        file_base_name = os.path.basename(self.file_name)
         massedit.command_line(
             [
                 "massedit.py",
@@ -415,28 +571,15 @@ class TestMassEditWithZenFile(TestMassEditWithFile):  # pylint: disable=R0904
                 "-w",
                 "-s",
                 self.workspace.top_dir,
-                file_base_name,
+                self.file_base_name,
             ]
         )
         with io.open(self.file_name, "r") as new_file:
-            new_lines = new_file.readlines()
-        original_lines = zen.splitlines(True)
-        self.assertEqual(len(new_lines), len(original_lines))
-        n_lines = len(new_lines)
-        for line in range(n_lines):
-            if line != 16:
-                self.assertEqual(new_lines[line - 1], original_lines[line - 1])
-            else:
-                expected_line_16 = (
-                    "Although that way may not be obvious "
-                    + "at first unless you're Guido.\n"
-                )
-                self.assertEqual(new_lines[line - 1], expected_line_16)
+            self.assertEqual(new_file.read(), zen_guido)
 
     def test_command_line_check(self):
         """Check dry run via command line with start workspace option."""
-        out_file_name = self.workspace.get_file()
-        basename = os.path.basename(self.file_name)
+        out_file_name = os.path.join(self.workspace.top_dir, "out.txt")
         arguments = [
             "test",
             "-e",
@@ -445,20 +588,19 @@ class TestMassEditWithZenFile(TestMassEditWithFile):  # pylint: disable=R0904
             out_file_name,
             "-s",
             self.workspace.top_dir,
-            basename,
+            self.file_base_name,
         ]
         processed = massedit.command_line(arguments)
-        self.assertEqual(processed, [os.path.abspath(self.file_name)])
-        with io.open(self.file_name, "r") as updated_file:
-            new_lines = updated_file.readlines()
-        original_lines = zen.splitlines(True)
-        self.assertEqual(original_lines, new_lines)
-        self.assertTrue(os.path.exists(out_file_name))
+        self.assertEqual(processed, [self.file_abspath])
+        with io.open(self.file_name, "rb") as updated_file:
+            self.assertEqual(updated_file.read(), self.text_bytes)
+        with io.open(out_file_name, "r") as out_file:
+            self.assertIn("Guido", out_file.read())
         os.unlink(out_file_name)
 
     def test_absolute_path_arg(self):
         """Check dry run via command line with single file name argument."""
-        out_file_name = self.workspace.get_file()
+        out_file_name = os.path.join(self.workspace.top_dir, "out.txt")
         arguments = [
             "massedit.py",
             "-e",
@@ -468,19 +610,17 @@ class TestMassEditWithZenFile(TestMassEditWithFile):  # pylint: disable=R0904
             self.file_name,
         ]
         processed = massedit.command_line(arguments)
-        self.assertEqual(processed, [os.path.abspath(self.file_name)])
-        with io.open(self.file_name, "r") as updated_file:
-            new_lines = updated_file.readlines()
-        original_lines = zen.splitlines(True)
-        self.assertEqual(original_lines, new_lines)
-        self.assertTrue(os.path.exists(out_file_name))
+        self.assertEqual(processed, [self.file_abspath])
+        with io.open(self.file_name, "rb") as updated_file:
+            self.assertEqual(updated_file.read(), self.text_bytes)
+        with io.open(out_file_name, "r") as out_file:
+            self.assertIn("Guido", out_file.read())
         os.unlink(out_file_name)
 
     def test_api(self):
         """Check simple replacement via api."""
-        file_base_name = os.path.basename(self.file_name)
         processed = massedit.edit_files(
-            [file_base_name],
+            [self.file_base_name],
             ["re.sub('Dutch', 'Guido', line)"],
             [],
             start_dirs=self.workspace.top_dir,
@@ -488,37 +628,29 @@ class TestMassEditWithZenFile(TestMassEditWithFile):  # pylint: disable=R0904
         )
         self.assertEqual(processed, [self.file_name])
         with io.open(self.file_name, "r") as new_file:
-            new_lines = new_file.readlines()
-        original_lines = zen.splitlines(True)
-        self.assertEqual(len(new_lines), len(original_lines))
-        n_lines = len(new_lines)
-        for line in range(n_lines):
-            if line != 16:
-                self.assertEqual(new_lines[line - 1], original_lines[line - 1])
-            else:
-                expected_line_16 = (
-                    "Although that way may not be obvious "
-                    + "at first unless you're Guido.\n"
-                )
-                self.assertEqual(new_lines[line - 1], expected_line_16)
+            self.assertEqual(new_file.read(), zen_guido)
+
+    def test_api_return_content(self):
+        """Check the edited content is returned without reading the file."""
+        contents = massedit.edit_files(
+            [self.file_base_name],
+            ["re.sub('Dutch', 'Guido', line)"],
+            start_dirs=self.workspace.top_dir,
+            dry_run=False,
+            return_content=True,
+        )
+        self.assertEqual(contents, {self.file_name: zen_guido})
 
     @unittest.skipIf(
         platform.system() == "Windows", "No exec bit for Python on windows"
     )
     def test_preserve_permissions(self):
         """Test that the exec bit is preserved when processing file."""
-        import stat
-
-        def is_executable(file_name):
-            """Check if the file has the exec bit set."""
-            return stat.S_IXUSR & os.stat(file_name)[stat.ST_MODE] > 0
-
-        self.assertFalse(is_executable(self.file_name))
-        mode = os.stat(self.file_name)[stat.ST_MODE] | stat.S_IEXEC
+        original_mode = os.stat(self.file_name).st_mode
+        self.assertFalse(original_mode & stat.S_IXUSR)
+        mode = original_mode | stat.S_IEXEC
         # Windows supports READ and WRITE, but not EXEC bit.
         os.chmod(self.file_name, mode)
-        self.assertTrue(is_executable(self.file_name))
-        file_base_name = os.path.basename(self.file_name)
         massedit.command_line(
             [
                 "massedit.py",
@@ -528,11 +660,10 @@ class TestMassEditWithZenFile(TestMassEditWithFile):  # pylint: disable=R0904
                 "-w",
                 "-s",
                 self.workspace.top_dir,
-                file_base_name,
+                self.file_base_name,
             ]
         )
-        statinfo = os.stat(self.file_name)
-        self.assertEqual(statinfo.st_mode, mode)
+        self.assertEqual(os.stat(self.file_name).st_mode, mode)
 
 
 class TestMassEditWalk(unittest.TestCase):  # pylint: disable=R0904
@@ -543,17 +674,29 @@ class TestMassEditWalk(unittest.TestCase):  # pylint: disable=R0904
         self.workspace = Workspace()
         self.subdirectory = self.workspace.get_directory()
         self.file_names = []
-        for ii in range(3):
+        self.original_contents = ["some text {}".format(ii) for ii in range(3)]
+        for content in self.original_contents:
             file_name = self.workspace.get_file(
                 parent_dir=self.subdirectory, extension=".txt"
             )
-            with io.open(file_name, "w+") as fh:
-                fh.write(unicode("some text ") + unicode(ii))
+            fd = os.open(file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, content.encode("ascii"))
+            finally:
+                os.close(fd)
             self.file_names.append(file_name)
 
     def tearDown(self):
         self.workspace.cleanup()
 
+    def read_files(self):
+        """Return the contents of the test files."""
+        contents = []
+        for file_name in self.file_names:
+            with io.open(file_name) as fh:
+                contents.append(fh.read())
+        return contents
+
     def test_feature(self):
         """Trivial test to make sure setUp and tearDown work."""
         pass
@@ -568,24 +711,12 @@ class TestMassEditWalk(unittest.TestCase):  # pylint: disable=R0904
             output=output,
         )
         self.assertEqual(sorted(processed_files), sorted(self.file_names))
-        index = {}
-        for ii, file_name in enumerate(self.file_names):
-            with io.open(file_name) as fh:
-                new_lines = fh.readlines()
-            self.assertEqual(new_lines, ["some text " + unicode(ii)])
-            index[file_name] = ii
+        self.assertEqual(self.read_files(), self.original_contents)
+        index = {file_name: ii for ii, file_name in enumerate(self.file_names)}
         actual = output.getvalue()
         expected = "".join(
-            [
-                textwrap.dedent(
-                    """\
-                            --- {}
-                            +++ <new>
-                            @@ -1 +1 @@
-                            -some text {}+some blah blah {}"""
-                ).format(file_name, index[file_name], index[file_name])
-                for file_name in processed_files
-            ]
+            dry_run_diff_template.format(file_name, index[file_name], index[file_name])
+            for file_name in processed_files
         )
         self.assertEqual(actual, expected)
 
@@ -599,24 +730,12 @@ class TestMassEditWalk(unittest.TestCase):  # pylint: disable=R0904
             output=output,
         )
         self.assertEqual(processed_files, self.file_names[1:2])
-        index = {}
-        for ii, file_name in enumerate(self.file_names):
-            with io.open(file_name) as fh:
-                new_lines = fh.readlines()
-            self.assertEqual(new_lines, ["some text " + unicode(ii)])
-            index[file_name] = ii
+        self.assertEqual(self.read_files(), self.original_contents)
+        index = {file_name: ii for ii, file_name in enumerate(self.file_names)}
         actual = output.getvalue()
         expected = "".join(
-            [
-                textwrap.dedent(
-                    """\
-                            --- {}
-                            +++ <new>
-                            @@ -1 +1 @@
-                            -some text {}+some blah blah {}"""
-                ).format(file_name, index[file_name], index[file_name])
-                for file_name in processed_files
-            ]
+            dry_run_diff_template.format(file_name, index[file_name], index[file_name])
+            for file_name in processed_files
         )
         self.assertEqual(actual, expected)
 
@@ -633,10 +752,90 @@ class TestMassEditWalk(unittest.TestCase):  # pylint: disable=R0904
         ]
         processed_files = massedit.command_line(arguments)
         self.assertEqual(sorted(processed_files), sorted(self.file_names))
-        for ii, file_name in enumerate(self.file_names):
-            with io.open(file_name) as fh:
-                new_lines = fh.readlines()
-            self.assertEqual(new_lines, ["some blah blah " + unicode(ii)])
+        expected = [
+            text.replace("text", "blah blah") for text in self.original_contents
+        ]
+        self.assertEqual(self.read_files(), expected)
+
+    def test_process_subdirectory_jobs(self):
+        """Check files edited in parallel give the same output in order."""
+        expressions = ["re.sub('text', 'blah blah', line)"]
+        kwds = {"start_dirs": self.workspace.top_dir, "expressions": expressions}
+        expected = io.StringIO()
+        expected_files = massedit.edit_files(["*.txt"], output=expected, **kwds)
+        output = io.StringIO()
+        processed_files = massedit.edit_files(["*.txt"], output=output, jobs=2, **kwds)
+        self.assertEqual(processed_files, expected_files)
+        self.assertEqual(output.getvalue(), expected.getvalue())
+        self.assertEqual(self.read_files(), self.original_contents)
+
+    def test_process_subdirectory_jobs_write(self):
+        """Check the -j option edits files in place in worker processes."""
+        arguments = [
+            "-r",
+            "-s",
+            self.workspace.top_dir,
+            "-w",
+            "-j",
+            "2",
+            "-e",
+            "re.sub('text', 'blah blah', line)",
+            "*.txt",
+        ]
+        processed_files = massedit.command_line(arguments)
+        self.assertEqual(sorted(processed_files), sorted(self.file_names))
+        expected = [
+            text.replace("text", "blah blah") for text in self.original_contents
+        ]
+        self.assertEqual(self.read_files(), expected)
+
+    def test_return_content(self):
+        """Check the new content of the files can be returned directly."""
+        expressions = ["re.sub('text', 'blah blah', line)"]
+        expected = [
+            text.replace("text", "blah blah") for text in self.original_contents
+        ]
+        for jobs in (1, 2):
+            contents = massedit.edit_files(
+                ["*.txt"],
+                expressions=expressions,
+                start_dirs=self.workspace.top_dir,
+                output=io.StringIO(),
+                jobs=jobs,
+                return_content=True,
+            )
+            self.assertEqual(
+                [contents[file_name] for file_name in self.file_names], expected
+            )
+
+    def test_max_depth_levels(self):
+        """Check the start directory and its subdirectories share depth 1."""
+        deeper = self.workspace.get_directory(parent_dir=self.subdirectory)
+        deeper_file = self.workspace.get_file(parent_dir=deeper, extension=".txt")
+        kwds = {"start_dirs": self.workspace.top_dir}
+        paths = list(massedit.get_paths(["*.txt"], max_depth=1, **kwds))
+        self.assertEqual(sorted(paths), sorted(self.file_names))
+        paths = list(massedit.get_paths(["*.txt"], max_depth=2, **kwds))
+        self.assertEqual(sorted(paths), sorted(self.file_names + [deeper_file]))
+        paths = list(massedit.get_paths(["*.txt"], max_depth=None, **kwds))
+        self.assertEqual(sorted(paths), sorted(self.file_names + [deeper_file]))
+
+    def test_jobs_with_callable(self):
+        """Check callables, which may not pickle, are applied in one process."""
+        with mock.patch.object(massedit, "_edit_paths_in_workers") as workers:
+            with LogInterceptor(massedit.log) as log_sink:
+                processed_files = massedit.edit_files(
+                    ["*.txt"],
+                    functions=[lambda lines, _: [line.upper() for line in lines]],
+                    start_dirs=self.workspace.top_dir,
+                    dry_run=False,
+                    jobs=2,
+                )
+        workers.assert_not_called()
+        self.assertIn("using a single process", log_sink.log)
+        self.assertEqual(sorted(processed_files), sorted(self.file_names))
+        expected = [text.upper() for text in self.original_contents]
+        self.assertEqual(self.read_files(), expected)
 
     def test_maxdepth_one(self):
         """Check that specifying -m 1 prevents modifiction to subdir."""
@@ -653,10 +852,105 @@ class TestMassEditWalk(unittest.TestCase):  # pylint: disable=R0904
         ]
         processed_files = massedit.command_line(arguments)
         self.assertEqual(processed_files, [])
-        for ii, file_name in enumerate(self.file_names):
-            with io.open(file_name) as fh:
-                new_lines = fh.readlines()
-            self.assertEqual(new_lines, ["some text " + unicode(ii)])
+        self.assertEqual(self.read_files(), self.original_contents)
+
+
+class TestUnifiedDiff(unittest.TestCase):
+
+    """Test the unified_diff function."""
+
+    def setUp(self):
+        self.from_lines = ["line {}\n".format(ii) for ii in range(100)]
+
+    def check_same_as_difflib(self, to_lines, n=3, aligned=False):
+        """Check the diff of self.from_lines and to_lines matches difflib."""
+        actual = list(
+            massedit.unified_diff(
+                self.from_lines, to_lines, "a", "b", n=n, aligned=aligned
+            )
+        )
+        expected = list(difflib.unified_diff(self.from_lines, to_lines, "a", "b", n=n))
+        self.assertEqual(actual, expected)
+
+    def test_no_change(self):
+        """Identical lines have no diff."""
+        self.check_same_as_difflib(list(self.from_lines))
+
+    @mock.patch("difflib.unified_diff")
+    def test_no_change_skips_difflib(self, unified_diff):
+        """Identical lines are not handed over to difflib."""
+        to_lines = list(self.from_lines)
+        self.assertEqual(list(massedit.unified_diff(self.from_lines, to_lines)), [])
+        unified_diff.assert_not_called()
+
+    def test_changes_in_the_middle(self):
+        """Hunk headers are shifted past the trimmed common lines."""
+        to_lines = list(self.from_lines)
+        to_lines[50] = "changed\n"
+        to_lines[70] = "changed too\n"
+        self.check_same_as_difflib(to_lines)
+
+    def test_insertion_and_deletion(self):
+        """Empty ranges in the hunk headers are shifted too."""
+        to_lines = list(self.from_lines)
+        to_lines.insert(40, "inserted\n")
+        del to_lines[80]
+        self.check_same_as_difflib(to_lines)
+
+    def test_change_at_the_edges(self):
+        """Changes on the first and last lines keep partial context."""
+        to_lines = ["first\n"] + self.from_lines[1:-1] + ["last\n"]
+        self.check_same_as_difflib(to_lines)
+
+    def test_aligned_changes(self):
+        """Lines edited in place give the same diff without difflib."""
+        to_lines = list(self.from_lines)
+        for index in (0, 5, 6, 12, 50, 57, 99):
+            to_lines[index] = "changed {}\n".format(index)
+        for n in (0, 1, 3):
+            self.check_same_as_difflib(to_lines, n=n, aligned=True)
+        with mock.patch("difflib.unified_diff") as unified_diff:
+            list(massedit.unified_diff(self.from_lines, to_lines, aligned=True))
+        unified_diff.assert_not_called()
+
+    def test_aligned_different_lengths(self):
+        """Aligned lines of different lengths fall back on difflib."""
+        to_lines = self.from_lines[:50] + ["inserted\n"] + self.from_lines[50:]
+        self.check_same_as_difflib(to_lines, aligned=True)
+
+    def test_trimmed_repeated_lines(self):
+        """Trimmed common lines may change difflib's hunks on repeated lines."""
+        from_lines = ["a\n"] * 5
+        to_lines = ["b\n"] + ["a\n"] * 4
+        diffs = list(massedit.unified_diff(from_lines, to_lines, "a", "b"))
+        self.assertEqual(
+            diffs,
+            ["--- a\n", "+++ b\n", "@@ -1,4 +1,4 @@\n", "+b\n"]
+            + [" a\n"] * 3
+            + ["-a\n"],
+        )
+
+    def test_aligned_repeated_lines(self):
+        """Aligned lines are paired by position, even when they repeat."""
+        from_lines = ["a\n", "b\n", "a\n", "b\n"]
+        to_lines = ["a\n", "b\n", "b\n", "a\n"]
+        diffs = list(
+            massedit.unified_diff(from_lines, to_lines, "a", "b", aligned=True)
+        )
+        self.assertEqual(
+            diffs,
+            [
+                "--- a\n",
+                "+++ b\n",
+                "@@ -1,4 +1,4 @@\n",
+                " a\n",
+                " b\n",
+                "-a\n",
+                "-b\n",
+                "+b\n",
+                "+a\n",
+            ],
+        )
 
 
 class TestIsList(unittest.TestCase):
@@ -691,6 +985,24 @@ class TestCommandLine(unittest.TestCase):  # pylint: disable=R0904
         arguments = massedit.parse_command_line(argv)
         self.assertEqual(arguments.expressions, [expr_name])
 
+    def test_jobs_at_least_one(self):
+        """Check the number of jobs must be positive."""
+        argv = ["massedit.py", "-j", "0", "-e", "line", "tests.py"]
+        with mock.patch("sys.stderr", new=io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit):
+                massedit.parse_command_line(argv)
+        self.assertIn("--jobs must be at least 1", stderr.getvalue())
+
+    def test_parser_built_once(self):
+        """Check the parser is reused and the output follows sys.stdout."""
+        argv = ["massedit.py", "-e", "line", "tests.py"]
+        massedit.parse_command_line(argv)
+        with mock.patch("argparse.ArgumentParser") as parser_class:
+            with mock.patch("sys.stdout", new=io.StringIO()) as stdout:
+                arguments = massedit.parse_command_line(argv)
+        parser_class.assert_not_called()
+        self.assertIs(arguments.output, stdout)
+
     def test_parse_function(self):
         """Simple test to show function is handled by parser."""
         function_name = "tests:dutch_is_guido"
@@ -703,7 +1015,8 @@ class TestCommandLine(unittest.TestCase):  # pylint: disable=R0904
         with self.assertRaises(TypeError):
             massedit.edit_files("test", [], [])
 
-    def test_file_option(self):
+    @mock.patch("massedit.readlines", return_value=["some content\n"])
+    def test_file_option(self, _):
         """Test processing of a file."""
 
         def add_header(data, _):
@@ -721,17 +1034,17 @@ class TestCommandLine(unittest.TestCase):  # pylint: disable=R0904
 
     def test_bad_module(self):
         """Test error when a bad module is passed to the command."""
-        log_sink = LogInterceptor(massedit.log)
-        with self.assertRaises(ImportError):
-            massedit.edit_files(["tests.py"], functions=["bong:modify"])
+        with LogInterceptor(massedit.log) as log_sink:
+            with self.assertRaises(ImportError):
+                massedit.edit_files(["tests.py"], functions=["bong:modify"])
         expected = "failed to import bong\n"
         self.assertEqual(log_sink.log, expected)
 
     def test_empty_function(self):
         """Test empty argument."""
-        log_sink = LogInterceptor(massedit.log)
-        with self.assertRaises(AttributeError):
-            massedit.edit_files(["tests.py"], functions=[":"])
+        with LogInterceptor(massedit.log) as log_sink:
+            with self.assertRaises(AttributeError):
+                massedit.edit_files(["tests.py"], functions=[":"])
         expected = (
             "':' is not a callable function: " + "'dict' object has no attribute ''\n"
         )
@@ -739,17 +1052,17 @@ class TestCommandLine(unittest.TestCase):  # pylint: disable=R0904
 
     def test_bad_function_name(self):
         """Check error when the function name is not valid."""
-        log_sink = LogInterceptor(massedit.log)
-        with self.assertRaises(AttributeError):
-            massedit.edit_files(["tests.py"], functions=["massedit:bad_fun"])
+        with LogInterceptor(massedit.log) as log_sink:
+            with self.assertRaises(AttributeError):
+                massedit.edit_files(["tests.py"], functions=["massedit:bad_fun"])
         expected = "has no attribute 'bad_fun'\n"
         self.assertIn(expected, log_sink.log)
 
     def test_missing_function_name(self):
         """Check error when the function is empty but not the module."""
-        log_sink = LogInterceptor(massedit.log)
-        with self.assertRaises(AttributeError):
-            massedit.edit_files(["tests.py"], functions=["massedit:"])
+        with LogInterceptor(massedit.log) as log_sink:
+            with self.assertRaises(AttributeError):
+                massedit.edit_files(["tests.py"], functions=["massedit:"])
         expected = (
             "'massedit:' is not a callable function: "
             + "'dict' object has no attribute 'massedit'\n"
@@ -758,9 +1071,9 @@ class TestCommandLine(unittest.TestCase):  # pylint: disable=R0904
 
     def test_wrong_number_of_argument(self):
         """Test passing function that has the wrong number of arguments."""
-        log_sink = LogInterceptor(massedit.log)
-        with self.assertRaises(ValueError):
-            massedit.edit_files(["tests.py"], functions=["massedit:get_function"])
+        with LogInterceptor(massedit.log) as log_sink:
+            with self.assertRaises(ValueError):
+                massedit.edit_files(["tests.py"], functions=["massedit:get_function"])
         expected = (
             "'massedit:get_function' is not a callable function: "
             + "function should take 2 arguments: lines, file_name\n"
@@ -775,10 +1088,12 @@ class TestCommandLine(unittest.TestCase):  # pylint: disable=R0904
             raise ZeroDivisionError()
 
         output = io.StringIO()
-        massedit.log.disabled = True
-        with self.assertRaises(ZeroDivisionError):
-            massedit.edit_files(["tests.py"], [], [divide_by_zero], output=output)
-        massedit.log.disabled = False
+        logging.disable(logging.CRITICAL)
+        try:
+            with self.assertRaises(ZeroDivisionError):
+                massedit.edit_files(["tests.py"], [], [divide_by_zero], output=output)
+        finally:
+            logging.disable(logging.NOTSET)
 
     def test_exec_option(self):
         """Check trivial call using executable."""
@@ -792,7 +1107,8 @@ class TestCommandLine(unittest.TestCase):  # pylint: disable=R0904
         self.assertEqual(actual[3], "-#!/usr/bin/env python")
         self.assertEqual(actual[-1], "+#!/usr/bin/env python+")
 
-    def test_write_to_cp437_output(self):
+    @mock.patch("massedit.readlines", return_value=["J\u00e9r\u00f4me paid \u20ac1\n"])
+    def test_write_to_cp437_output(self, _):
         """Check writing to a cp437 output (e.g. Windows console)."""
         raw = io.BytesIO()
         output = io.TextIOWrapper(